@@ -5,26 +5,71 @@ Monitors voice commands and executes scripts with visual feedback.
 """
 
 import argparse
-import difflib
 import json
 import os
+import queue
+import re
 import signal
 import subprocess
 import sys
 import threading
 import time
 from collections import deque
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from vosk import Model, KaldiRecognizer
 import pyaudio
 
+# Fuzzy-matching backends, fastest first: RapidFuzz (C++), a Numba-compiled
+# Levenshtein kernel, and difflib as the last pure-Python resort.
+try:
+    from rapidfuzz import fuzz, process
+    _FUZZY_BACKEND = "rapidfuzz"
+except ImportError:
+    try:
+        import numpy as np
+        from numba import njit
+
+        @njit(cache=True)
+        def _lev_ratio(a, b):
+            """Levenshtein similarity of two uint8 arrays, rolling-row style"""
+            la, lb = a.shape[0], b.shape[0]
+            if la == 0 or lb == 0:
+                return 0.0
+            row = np.arange(lb + 1, dtype=np.int32)
+            for i in range(1, la + 1):
+                prev = row[0]
+                row[0] = i
+                for j in range(1, lb + 1):
+                    cur = row[j]
+                    val = prev + (0 if a[i - 1] == b[j - 1] else 1)
+                    if row[j - 1] + 1 < val:
+                        val = row[j - 1] + 1
+                    if cur + 1 < val:
+                        val = cur + 1
+                    row[j] = val
+                    prev = cur
+            return 1.0 - row[lb] / max(la, lb)
+
+        _FUZZY_BACKEND = "numba"
+    except ImportError:
+        import difflib
+        _FUZZY_BACKEND = "difflib"
+
 from rich.console import Console
 from rich.layout import Layout
 from rich.live import Live
 from rich.panel import Panel
 from rich.text import Text
 from rich.columns import Columns
-from rich.align import Align
+
+# Vosk results are flat JSON; pulling out "text" directly avoids a full parse
+_TEXT_RE = re.compile(r'"text"\s*:\s*"([^"]*)"')
+
+SAMPLE_RATE = 16000
+# 200 ms at 16 kHz - the chunk size Vosk processes internally. Capturing in
+# the same unit avoids re-buffering inside the recognizer and keeps
+# per-utterance latency at a single buffer.
+FRAMES_PER_BUFFER = 3200
 
 class VoiceCommandMonitor:
     def __init__(self, keywords, model_path, highlight_duration=1.0):
@@ -34,16 +79,72 @@ class VoiceCommandMonitor:
         self.running = True
         self.console = Console()
 
+        # Keyword lookup tables for fast matching
+        self._kw_list = tuple(keywords.keys())
+        self._kw_lower = tuple(kw.lower() for kw in self._kw_list)
+        self._kw_exact = {kw.lower(): kw for kw in self._kw_list}
+        # A similarity ratio is bounded by 2*min(|a|,|b|)/(|a|+|b|), which
+        # stays below the 80% threshold only when the length ratio is under
+        # 2/3. Words outside that range against every keyword are skipped
+        # before the fuzzy scorer runs.
+        kw_lens = [len(kw) for kw in self._kw_lower]
+        self._min_word_len = min(kw_lens) * 2 // 3
+        self._max_word_len = max(kw_lens) * 3 // 2
+        if _FUZZY_BACKEND == "numba":
+            self._kw_np = [np.frombuffer(kw.encode(), dtype=np.uint8)
+                           for kw in self._kw_lower]
+            _lev_ratio(self._kw_np[0], self._kw_np[0])  # warm up the JIT
+
         # UI State
         self.keyword_counts = {kw: 0 for kw in keywords.keys()}
         self.keyword_highlighted = {kw: 0.0 for kw in keywords.keys()}
-        self.recognized_words = deque(maxlen=50)  # Last 50 recognized words
+        # The audio worker publishes (counts, highlights) tuples in one
+        # reference swap; the UI thread only ever reads the snapshot.
+        self._kw_snapshot = (tuple(self.keyword_counts.values()),
+                             tuple(self.keyword_highlighted.values()))
+        self._recent_words = deque(maxlen=20)  # Last 20 recognized words
+        self._recent_text = ""  # Pre-joined for the scrolling panel
+        self._scroll_text = Text("Waiting for speech...", style="dim", overflow="ellipsis")
+        self._scroll_panel = Panel(self._scroll_text,
+                                   title="Recognized Words",
+                                   border_style="yellow")
         self.script_log = deque(maxlen=20)  # Last 20 script executions
+        self._log_dirty = False  # True when the log text needs re-rendering
+        self._log_text = Text("No script executions yet", style="dim")
+        self._log_panel = Panel(self._log_text,
+                                title="Script Executions",
+                                border_style="cyan",
+                                height=10)
+
+        # Keyword panels are built once and mutated in place on redraw
+        self._kw_texts = {kw: Text(f"{kw}\n\n0", justify="center", style="bold")
+                          for kw in keywords.keys()}
+        self._kw_panels = {kw: Panel(self._kw_texts[kw],
+                                     title=f"Keyword: {kw}",
+                                     border_style="blue",
+                                     style="white on blue",
+                                     height=5)
+                           for kw in keywords.keys()}
+        self._kw_columns = Columns(list(self._kw_panels.values()), equal=True, expand=True)
+
+        # The Layout is likewise built once and its sections updated in place
+        self._layout = Layout()
+        self._layout.split(
+            Layout(name="keywords", size=8),
+            Layout(name="scrolling", size=5),
+            Layout(name="log", size=12)
+        )
 
         # Audio components
-        self.audio_queue = []
         self.audio_thread = None
         self.ui_thread = None
+        self._audio_q = queue.Queue(maxsize=32)
+
+        # Persistent worker pool for script execution
+        self._script_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="script")
+
+        # Set by the audio worker whenever UI state changed
+        self._dirty = threading.Event()
 
         # Signal handlers
         signal.signal(signal.SIGINT, self.signal_handler)
@@ -51,6 +152,7 @@ class VoiceCommandMonitor:
 
     def signal_handler(self, signum, frame):
         self.running = False
+        self._dirty.set()  # wake the UI loop so shutdown is immediate
 
     def setup_recognizer(self):
         if not os.path.exists(self.model_path):
@@ -59,30 +161,48 @@ class VoiceCommandMonitor:
             sys.exit(1)
 
         model = Model(self.model_path)
-        rec = KaldiRecognizer(model, 16000)
+        # Restrict decoding to the keyword vocabulary: recognition gets much
+        # faster and every result token is either a keyword or [unk], so the
+        # exact-match fast path handles virtually all hits.
+        grammar = json.dumps(list(self._kw_lower) + ["[unk]"])
+        rec = KaldiRecognizer(model, SAMPLE_RATE, grammar)
+        rec.SetWords(False)  # we only read the "text" field
         return rec
 
+    def audio_callback(self, in_data, frame_count, time_info, status):
+        """PortAudio callback - hands chunks to the consumer without blocking"""
+        try:
+            self._audio_q.put_nowait(in_data)
+        except queue.Full:
+            pass  # consumer is behind, drop the chunk instead of stalling capture
+        return (None, pyaudio.paContinue)
+
     def audio_worker(self):
-        """Background thread for audio processing"""
+        """Background thread consuming captured audio for recognition"""
         rec = self.setup_recognizer()
         p = pyaudio.PyAudio()
         stream = p.open(format=pyaudio.paInt16,
                         channels=1,
-                        rate=16000,
+                        rate=SAMPLE_RATE,
                         input=True,
-                        frames_per_buffer=8000)
+                        frames_per_buffer=FRAMES_PER_BUFFER,
+                        stream_callback=self.audio_callback)
 
         while self.running:
             try:
-                data = stream.read(4000, exception_on_overflow=False)
+                try:
+                    data = self._audio_q.get(timeout=0.25)
+                except queue.Empty:
+                    continue
                 if rec.AcceptWaveform(data):
-                    result = json.loads(rec.Result())
-                    text = result.get("text", "").lower().strip()
+                    match = _TEXT_RE.search(rec.Result())
+                    text = match.group(1).lower().strip() if match else ""
                     if text:
                         # Add to recognized words for scrolling text
-                        words = text.split()
-                        for word in words:
-                            self.recognized_words.append(word)
+                        words = [word for word in text.split() if word != "[unk]"]
+                        if words:
+                            self._recent_words.extend(words)
+                            self._recent_text = " ".join(self._recent_words)
 
                         # Check for keyword matches
                         best_match = self.find_best_keyword_match(text)
@@ -90,9 +210,12 @@ class VoiceCommandMonitor:
                             keyword, script, confidence = best_match
                             self.keyword_counts[keyword] += 1
                             self.keyword_highlighted[keyword] = time.time()
+                            self.publish_snapshot()
 
                             # Execute script in background
-                            threading.Thread(target=self.execute_script, args=(keyword, script)).start()
+                            self._script_pool.submit(self.execute_script, keyword, script)
+
+                        self._dirty.set()
 
             except Exception as e:
                 if self.running:
@@ -105,118 +228,170 @@ class VoiceCommandMonitor:
     def find_best_keyword_match(self, text):
         """Find the best matching keyword using fuzzy matching"""
         best_match = None
-        best_ratio = 0.0
-
-        for keyword in self.keywords.keys():
-            words = text.split()
-            for word in words:
-                ratio = difflib.SequenceMatcher(None, keyword.lower(), word.lower()).ratio()
-                if ratio > best_ratio and ratio > 0.8:  # 80% similarity threshold
-                    best_ratio = ratio
-                    best_match = (keyword, self.keywords[keyword], ratio)
+        best_score = 80.0  # 80% similarity threshold
+        words = [word.lower() for word in text.split()]
+
+        # Fast path: an exact hit needs only one dict lookup per word
+        for word in words:
+            if word in self._kw_exact:
+                keyword = self._kw_exact[word]
+                return (keyword, self.keywords[keyword], 1.0)
+
+        for word in words:
+            if not self._min_word_len <= len(word) <= self._max_word_len:
+                continue
+            match = self.fuzzy_score(word, best_score)
+            if match:
+                score, index = match
+                if score > best_score:
+                    best_score = score
+                    keyword = self._kw_list[index]
+                    best_match = (keyword, self.keywords[keyword], score / 100)
+                    if score >= 100.0:  # cannot improve on a perfect match
+                        break
 
         return best_match
 
+    def fuzzy_score(self, word, score_cutoff):
+        """Best (score, keyword index) for a word on a 0-100 scale"""
+        if _FUZZY_BACKEND == "rapidfuzz":
+            match = process.extractOne(word, self._kw_lower,
+                                       scorer=fuzz.ratio, score_cutoff=score_cutoff)
+            return (match[1], match[2]) if match else None
+
+        if _FUZZY_BACKEND == "numba":
+            word_np = np.frombuffer(word.encode(), dtype=np.uint8)
+            scores = (_lev_ratio(kw_np, word_np) * 100 for kw_np in self._kw_np)
+        else:
+            scores = (difflib.SequenceMatcher(None, kw, word).ratio() * 100
+                      for kw in self._kw_lower)
+
+        best = None
+        for index, score in enumerate(scores):
+            if score >= score_cutoff and (best is None or score > best[0]):
+                best = (score, index)
+        return best
+
     def execute_script(self, keyword, script_path):
         """Execute script and log the result"""
-        timestamp = datetime.now().strftime("%H:%M:%S")
-
-        # Correct relative paths
-        if not os.path.isabs(script_path) and not script_path.startswith('./'):
-            script_path = './' + script_path
+        started = time.time()
 
         try:
-            result = subprocess.run([script_path], check=True, capture_output=True, text=True, timeout=30)
-            status = "SUCCESS"
-            output = result.stdout.strip() if result.stdout else ""
-        except subprocess.TimeoutExpired:
-            status = "TIMEOUT"
-            output = "Script timed out"
-        except subprocess.CalledProcessError as e:
-            status = "ERROR"
-            output = e.stderr.strip() if e.stderr else str(e)
+            proc = subprocess.Popen([script_path], stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE, text=True)
+            try:
+                out, err = proc.communicate(timeout=30)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.communicate()
+                status = "TIMEOUT"
+                output = "Script timed out"
+            else:
+                if proc.returncode == 0:
+                    status = "SUCCESS"
+                    output = out.strip() if out else ""
+                else:
+                    status = "ERROR"
+                    output = err.strip() if err else f"exit code {proc.returncode}"
         except FileNotFoundError:
             status = "NOT_FOUND"
             output = f"Script not found: {script_path}"
+        except OSError as e:
+            # e.g. a script without the execute bit raises PermissionError;
+            # surface it in the log instead of dying silently in the pool
+            status = "ERROR"
+            output = str(e)
+
+        # Log the raw result; the UI thread formats it on demand
+        self.append_log((started, keyword, status, output[:50]))
 
-        # Log the execution
-        log_entry = f"[{timestamp}] {keyword} -> {status}"
+    def append_log(self, entry):
+        """Queue a raw (time, keyword, status, output) log entry"""
+        self.script_log.append(entry)
+        self._log_dirty = True
+        self._dirty.set()
+
+    def format_log_entry(self, entry):
+        """Render one raw log entry as a line of text"""
+        started, keyword, status, output = entry
+        line = f"[{time.strftime('%H:%M:%S', time.localtime(started))}] {keyword} -> {status}"
         if output:
-            log_entry += f" | {output[:50]}..."
-        self.script_log.append(log_entry)
+            line += f" | {output}..."
+        return line
+
+    def publish_snapshot(self):
+        """Publish a consistent counts/highlights snapshot for the UI thread"""
+        self._kw_snapshot = (tuple(self.keyword_counts.values()),
+                             tuple(self.keyword_highlighted.values()))
 
     def create_keyword_panels(self):
-        """Create panels for each keyword"""
-        panels = []
+        """Refresh the cached keyword panels"""
+        counts, highlights = self._kw_snapshot
         current_time = time.time()
 
-        for keyword in self.keywords.keys():
-            count = self.keyword_counts[keyword]
-            is_highlighted = (current_time - self.keyword_highlighted[keyword]) < self.highlight_duration
+        for index, (keyword, panel) in enumerate(self._kw_panels.items()):
+            is_highlighted = (current_time - highlights[index]) < self.highlight_duration
 
             if is_highlighted:
-                style = "bold green on black"
-                border_style = "green"
+                panel.style = "bold green on black"
+                panel.border_style = "green"
             else:
-                style = "white on blue"
-                border_style = "blue"
+                panel.style = "white on blue"
+                panel.border_style = "blue"
 
-            panel = Panel(
-                Align.center(f"[bold]{keyword}[/bold]\n\n[bold]{count}[/bold]"),
-                title=f"Keyword: {keyword}",
-                border_style=border_style,
-                style=style,
-                height=5
-            )
-            panels.append(panel)
+            self._kw_texts[keyword].plain = f"{keyword}\n\n{counts[index]}"
 
-        return Columns(panels, equal=True, expand=True)
+        return self._kw_columns
 
     def create_scrolling_text(self):
         """Create scrolling text of recognized words"""
-        if not self.recognized_words:
-            text = "[dim]Waiting for speech...[/dim]"
-        else:
-            words = list(self.recognized_words)[-20:]  # Show last 20 words
-            text = " ".join(words)
+        if self._recent_text:
+            self._scroll_text.style = ""
+            self._scroll_text.plain = self._recent_text
 
-        return Panel(
-            Text(text, overflow="ellipsis"),
-            title="Recognized Words",
-            border_style="yellow"
-        )
+        return self._scroll_panel
 
     def create_script_log(self):
         """Create script execution log"""
-        if not self.script_log:
-            log_text = "[dim]No script executions yet[/dim]"
-        else:
-            log_text = "\n".join(self.script_log)
-
-        return Panel(
-            log_text,
-            title="Script Executions",
-            border_style="cyan",
-            height=10
-        )
+        if self._log_dirty:
+            self._log_dirty = False
+            self._log_text.style = ""
+            self._log_text.plain = "\n".join(self.format_log_entry(entry)
+                                             for entry in self.script_log)
+        return self._log_panel
 
     def create_layout(self):
-        """Create the main layout"""
-        layout = Layout()
-
-        # Split into sections
-        layout.split(
-            Layout(name="keywords", size=8),
-            Layout(name="scrolling", size=5),
-            Layout(name="log", size=12)
-        )
-
-        # Populate sections
-        layout["keywords"].update(self.create_keyword_panels())
-        layout["scrolling"].update(self.create_scrolling_text())
-        layout["log"].update(self.create_script_log())
-
-        return layout
+        """Refresh the pre-built layout"""
+        self._layout["keywords"].update(self.create_keyword_panels())
+        self._layout["scrolling"].update(self.create_scrolling_text())
+        self._layout["log"].update(self.create_script_log())
+
+        return self._layout
+
+    def highlight_active(self):
+        """Check whether any keyword highlight is still fading"""
+        now = time.time()
+        return any(now - ts < self.highlight_duration
+                   for ts in self._kw_snapshot[1])
+
+    def ui_loop(self):
+        """Live UI loop - redraws only when state changed or a highlight expires"""
+        with Live(self.create_layout(), refresh_per_second=10, auto_refresh=False,
+                  console=self.console) as live:
+            was_highlighted = False
+            while self.running:
+                # Tick at 10 Hz while a highlight is fading, 1 Hz when idle;
+                # the dirty event wakes the loop immediately on new activity
+                changed = self._dirty.wait(timeout=0.1 if was_highlighted else 1.0)
+                if changed:
+                    self._dirty.clear()
+                if not self.running:
+                    break
+                highlighted = self.highlight_active()
+                # The extra redraw after a highlight expires clears the green border
+                if changed or highlighted or was_highlighted:
+                    live.update(self.create_layout(), refresh=True)
+                was_highlighted = highlighted
 
     def run(self):
         """Main run loop with live UI"""
@@ -227,12 +402,9 @@ class VoiceCommandMonitor:
         self.audio_thread = threading.Thread(target=self.audio_worker, daemon=True)
         self.audio_thread.start()
 
-        # Live UI loop
-        with Live(self.create_layout(), refresh_per_second=4, console=self.console) as live:
-            while self.running:
-                live.update(self.create_layout())
-                time.sleep(0.25)
+        self.ui_loop()
 
+        self._script_pool.shutdown(wait=False, cancel_futures=True)
         self.console.print("\n[yellow]Shutting down...[/yellow]")
 
     def demo(self):
@@ -242,24 +414,22 @@ class VoiceCommandMonitor:
 
         # Add some demo data
         demo_words = ["hello", "world", "test", "browser", "jupyter", "update", "system"]
-        for word in demo_words:
-            self.recognized_words.append(word)
+        self._recent_words.extend(demo_words)
+        self._recent_text = " ".join(self._recent_words)
 
         # Simulate keyword triggers
         self.keyword_counts["browser"] = 3
         self.keyword_counts["jupyter"] = 1
         self.keyword_counts["update"] = 2
+        self.publish_snapshot()
 
         # Add demo log entries
-        self.script_log.append("[10:15:23] browser -> SUCCESS | Opening browser...")
-        self.script_log.append("[10:15:45] jupyter -> SUCCESS | Starting Jupyter...")
-        self.script_log.append("[10:16:12] update -> SUCCESS | System updated")
+        now = time.time()
+        self.append_log((now - 109, "browser", "SUCCESS", "Opening browser"))
+        self.append_log((now - 87, "jupyter", "SUCCESS", "Starting Jupyter"))
+        self.append_log((now - 60, "update", "SUCCESS", "System updated"))
 
-        # Live UI loop
-        with Live(self.create_layout(), refresh_per_second=4, console=self.console) as live:
-            while self.running:
-                live.update(self.create_layout())
-                time.sleep(0.25)
+        self.ui_loop()
 
         self.console.print("\n[yellow]Demo ended...[/yellow]")
 
@@ -271,11 +441,8 @@ def parse_keywords(keywords_str):
             print(f"Invalid format: {kw_str}. Use 'keyword:script.sh'")
             continue
         keyword, script = kw_str.split(":", 1)
-        script = script.strip()
-        # Auto-correct relative paths
-        if not os.path.isabs(script) and not script.startswith('./'):
-            script = './' + script
-        keywords[keyword.strip()] = script
+        # Resolve relative paths once at startup
+        keywords[keyword.strip()] = os.path.abspath(script.strip())
     return keywords
 
 def main():
@@ -310,7 +477,7 @@ def main():
             monitor.execute_script(kw, script)
             # Show log entries
             if monitor.script_log:
-                print(f"  Result: {list(monitor.script_log)[-1]}")
+                print(f"  Result: {monitor.format_log_entry(monitor.script_log[-1])}")
         print("Test completed.")
         return
 